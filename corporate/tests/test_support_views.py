@@ -1905,7 +1905,7 @@ class TestSupportEndpoint(ZulipTestCase):
             "/activity/support", {"realm_id": f"{lear_realm.id}", "new_subdomain": "zulip"}
         )
         self.assert_in_success_response(
-            ["Subdomain is already in use. Please choose a different one."], result
+            ["Subdomain reserved. Please choose a different one."], result
         )
 
         result = self.client_post(
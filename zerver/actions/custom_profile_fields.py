@@ -210,33 +210,59 @@ def do_update_user_custom_profile_data_if_changed(
         )
 
 
-@transaction.atomic(savepoint=False)
-def check_remove_custom_profile_field_value(
-    user_profile: UserProfile, field_id: int, acting_user: UserProfile
-) -> None:
-    try:
-        custom_profile_field = CustomProfileField.objects.get(realm=user_profile.realm, id=field_id)
-        if not acting_user.is_realm_admin and not custom_profile_field.editable_by_user:
+def validate_custom_profile_field_values_removable(
+    realm: Realm, field_ids: list[int], acting_user: UserProfile
+) -> dict[int, CustomProfileField]:
+    # Fetch all the fields in bulk, rather than issuing a query per field.
+    custom_profile_fields = CustomProfileField.objects.filter(
+        realm=realm, id__in=field_ids
+    ).in_bulk()
+    for field_id in field_ids:
+        if field_id not in custom_profile_fields:
+            raise JsonableError(_("Field id {id} not found.").format(id=field_id))
+        if not acting_user.is_realm_admin and not custom_profile_fields[field_id].editable_by_user:
             raise JsonableError(
                 _(
                     "You are not allowed to change this field. Contact an administrator to update it."
                 )
             )
+    return custom_profile_fields
 
-        field_value = CustomProfileFieldValue.objects.get(
-            field=custom_profile_field, user_profile=user_profile
-        )
-        field_value.delete()
+
+@transaction.atomic(savepoint=False)
+def do_remove_custom_profile_field_values(
+    user_profile: UserProfile,
+    field_ids: list[int],
+    custom_profile_fields: dict[int, CustomProfileField],
+) -> None:
+    """custom_profile_fields must be the result of
+    validate_custom_profile_field_values_removable for field_ids."""
+    field_values = CustomProfileFieldValue.objects.filter(
+        user_profile=user_profile, field_id__in=field_ids
+    )
+    removed_field_ids = set(field_values.values_list("field_id", flat=True))
+    if not removed_field_ids:
+        return
+    field_values.delete()
+
+    for field_id in dict.fromkeys(field_ids):
+        if field_id not in removed_field_ids:
+            continue
         notify_user_update_custom_profile_data(
             user_profile,
             {
                 "id": field_id,
                 "value": None,
                 "rendered_value": None,
-                "type": custom_profile_field.field_type,
+                "type": custom_profile_fields[field_id].field_type,
             },
         )
-    except CustomProfileField.DoesNotExist:
-        raise JsonableError(_("Field id {id} not found.").format(id=field_id))
-    except CustomProfileFieldValue.DoesNotExist:
-        pass
+
+
+def check_remove_custom_profile_field_values(
+    user_profile: UserProfile, field_ids: list[int], acting_user: UserProfile
+) -> None:
+    custom_profile_fields = validate_custom_profile_field_values_removable(
+        user_profile.realm, field_ids, acting_user
+    )
+    do_remove_custom_profile_field_values(user_profile, field_ids, custom_profile_fields)
@@ -19,7 +19,7 @@ from zerver.actions.user_groups import (
     update_users_in_full_members_system_group,
 )
 from zerver.lib.avatar import get_avatar_field
-from zerver.lib.bot_config import ConfigError, get_bot_config, get_bot_configs, set_bot_config
+from zerver.lib.bot_config import ConfigError, bulk_set_bot_config, get_bot_config, get_bot_configs
 from zerver.lib.cache import bot_dict_fields
 from zerver.lib.create_user import create_user
 from zerver.lib.event_types import BotServicesOutgoing
@@ -834,8 +834,7 @@ def do_update_outgoing_webhook_service(
 
 @transaction.atomic(durable=True)
 def do_update_bot_config_data(bot_profile: UserProfile, config_data: dict[str, str]) -> None:
-    for key, value in config_data.items():
-        set_bot_config(bot_profile, key, value)
+    bulk_set_bot_config(bot_profile, config_data)
     updated_config_data = get_bot_config(bot_profile)
     send_event_on_commit(
         bot_profile.realm,
@@ -1,9 +1,12 @@
 import base64
+import hashlib
 import logging
 import re
 from email.headerregistry import Address
+from functools import lru_cache
 from typing import Any
 
+import dns.exception
 import dns.resolver
 import orjson
 from altcha import verify_solution
@@ -18,8 +21,8 @@ from django.forms.renderers import BaseRenderer
 from django.http import HttpRequest
 from django.utils.html import format_html
 from django.utils.safestring import SafeString
+from django.utils.translation import get_language, gettext_lazy
 from django.utils.translation import gettext as _
-from django.utils.translation import gettext_lazy
 from markupsafe import Markup
 from two_factor.forms import AuthenticationTokenForm as TwoFactorAuthenticationTokenForm
 from two_factor.utils import totp_digits
@@ -27,6 +30,7 @@ from typing_extensions import override
 
 from zerver.actions.user_settings import do_change_password
 from zerver.actions.users import do_send_password_reset_email
+from zerver.lib.cache import cache_with_key
 from zerver.lib.email_validation import (
     email_allowed_for_realm,
     email_reserved_for_system_bots_error,
@@ -36,6 +40,7 @@ from zerver.lib.exceptions import JsonableError, RateLimitedError
 from zerver.lib.i18n import get_language_list
 from zerver.lib.name_restrictions import is_reserved_subdomain
 from zerver.lib.rate_limiter import RateLimitedObject, rate_limit_request_by_ip
+from zerver.lib.sessions import get_session_altcha_challenges
 from zerver.lib.subdomains import get_subdomain, is_root_domain_available
 from zerver.lib.users import check_full_name
 from zerver.models import PreregistrationRealm, Realm, UserProfile
@@ -69,19 +74,65 @@ DEACTIVATED_ACCOUNT_ERROR = gettext_lazy(
     " Please contact your organization administrator to reactivate it."
 )
 PASSWORD_TOO_WEAK_ERROR = gettext_lazy("The password is too weak.")
+SUBDOMAIN_TOO_SHORT_ERROR = gettext_lazy("Subdomain needs to have length 3 or greater.")
+SUBDOMAIN_EXTREMAL_DASH_ERROR = gettext_lazy("Subdomain cannot start or end with a '-'.")
+SUBDOMAIN_BAD_CHARACTER_ERROR = gettext_lazy(
+    "Subdomain can only have lowercase letters, numbers, and '-'s."
+)
+SUBDOMAIN_UNAVAILABLE_ERROR = gettext_lazy(
+    "Subdomain is already in use. Please choose a different one."
+)
+SUBDOMAIN_RESERVED_ERROR = gettext_lazy("Subdomain reserved. Please choose a different one.")
+
+SUBDOMAIN_BAD_CHARACTER_RE = re.compile(r"[^a-z0-9-]")
+
+MIT_DNS_LOOKUP_ATTEMPTS = 3
+MIT_DNS_LOOKUP_LIFETIME = 2.0
+
+
+def mit_pobox_exists_cache_key(username: str) -> str:
+    return f"mit_pobox_exists:{hashlib.sha1(username.lower().encode()).hexdigest()}"
+
+
+# Hesiod records change rarely, so we cache the result of the DNS
+# lookup to avoid a network round-trip on every MIT signup attempt.
+@cache_with_key(mit_pobox_exists_cache_key, timeout=60 * 10)
+def mit_pobox_exists(username: str) -> bool:
+    # Bound the time a web worker can spend blocked on a slow
+    # resolver; only timeouts are retried, since NXDOMAIN is
+    # authoritative.  A timeout on the last attempt propagates, so
+    # that it is not cached.
+    for attempt in range(MIT_DNS_LOOKUP_ATTEMPTS):
+        try:
+            dns.resolver.resolve(
+                f"{username}.pobox.ns.athena.mit.edu", "TXT", lifetime=MIT_DNS_LOOKUP_LIFETIME
+            )
+        except dns.resolver.NXDOMAIN:
+            return False
+        except dns.exception.Timeout:
+            if attempt == MIT_DNS_LOOKUP_ATTEMPTS - 1:
+                raise
+            continue
+        return True
+    raise AssertionError("unreachable")
 
 
 def email_is_not_mit_mailing_list(email: str) -> None:
     """Prevent MIT mailing lists from signing up for Zulip"""
     address = Address(addr_spec=email)
-    if address.domain == "mit.edu":
-        # Check whether the user exists and can get mail.
-        try:
-            dns.resolver.resolve(f"{address.username}.pobox.ns.athena.mit.edu", "TXT")
-        except dns.resolver.NXDOMAIN:
-            # This error is Markup only because 1. it needs to render HTML
-            # 2. It's not formatted with any user input.
-            raise ValidationError(MIT_VALIDATION_ERROR)
+    if address.domain != "mit.edu":
+        return
+    # Check whether the user exists and can get mail.
+    try:
+        pobox_exists = mit_pobox_exists(address.username)
+    except dns.exception.Timeout:
+        # Don't block signups on a DNS outage.
+        logging.warning("Timed out checking whether %s is an MIT mailing list", email)
+        return
+    if not pobox_exists:
+        # This error is Markup only because 1. it needs to render HTML
+        # 2. It's not formatted with any user input.
+        raise ValidationError(MIT_VALIDATION_ERROR)
 
 
 class OverridableValidationError(ValidationError):
@@ -89,31 +140,25 @@ class OverridableValidationError(ValidationError):
 
 
 def check_subdomain_available(subdomain: str, allow_reserved_subdomain: bool = False) -> None:
-    error_strings = {
-        "too short": _("Subdomain needs to have length 3 or greater."),
-        "extremal dash": _("Subdomain cannot start or end with a '-'."),
-        "bad character": _("Subdomain can only have lowercase letters, numbers, and '-'s."),
-        "unavailable": _("Subdomain is already in use. Please choose a different one."),
-        "reserved": _("Subdomain reserved. Please choose a different one."),
-    }
-
     if subdomain == Realm.SUBDOMAIN_FOR_ROOT_DOMAIN:
         if is_root_domain_available():
             return
-        raise ValidationError(error_strings["unavailable"])
-    if subdomain[0] == "-" or subdomain[-1] == "-":
-        raise ValidationError(error_strings["extremal dash"])
-    if not re.match(r"^[a-z0-9-]*$", subdomain):
-        raise ValidationError(error_strings["bad character"])
+        raise ValidationError(SUBDOMAIN_UNAVAILABLE_ERROR)
+    if subdomain.startswith("-") or subdomain.endswith("-"):
+        raise ValidationError(SUBDOMAIN_EXTREMAL_DASH_ERROR)
+    if SUBDOMAIN_BAD_CHARACTER_RE.search(subdomain):
+        raise ValidationError(SUBDOMAIN_BAD_CHARACTER_ERROR)
     if len(subdomain) < 3:
-        raise ValidationError(error_strings["too short"])
-    if Realm.objects.filter(string_id=subdomain).exists():
-        raise ValidationError(error_strings["unavailable"])
+        raise ValidationError(SUBDOMAIN_TOO_SHORT_ERROR)
+    # Check the in-memory reserved list before paying for a database
+    # query.
     if is_reserved_subdomain(subdomain) and not allow_reserved_subdomain:
         raise OverridableValidationError(
-            error_strings["reserved"],
+            SUBDOMAIN_RESERVED_ERROR,
             "Pass --allow-reserved-subdomain to override",
         )
+    if Realm.objects.filter(string_id=subdomain).exists():
+        raise ValidationError(SUBDOMAIN_UNAVAILABLE_ERROR)
 
 
 def email_not_system_bot(email: str) -> None:
@@ -134,12 +179,28 @@ def email_is_not_disposable(email: str) -> None:
         raise ValidationError(_("Please use your real email address."))
 
 
+# These choices are static for the lifetime of the process, so we
+# build them once rather than on every form instantiation.
+ORG_TYPE_CHOICES = tuple((t["id"], t["name"]) for t in Realm.ORG_TYPES.values())
+HOW_REALM_CREATOR_FOUND_ZULIP_CHOICES = tuple(
+    RealmAuditLog.HOW_REALM_CREATOR_FOUND_ZULIP_OPTIONS.items()
+)
+EMAIL_ADDRESS_VISIBILITY_CHOICES = tuple(
+    UserProfile.EMAIL_ADDRESS_VISIBILITY_ID_TO_NAME_MAP.items()
+)
+
+
+@lru_cache(None)
+def get_language_choices() -> tuple[tuple[str, str], ...]:
+    return tuple((lang["code"], lang["name"]) for lang in get_language_list())
+
+
 class RealmDetailsForm(forms.Form):
     realm_subdomain = forms.CharField(max_length=Realm.MAX_REALM_SUBDOMAIN_LENGTH, required=False)
-    realm_type = forms.TypedChoiceField(
-        coerce=int, choices=[(t["id"], t["name"]) for t in Realm.ORG_TYPES.values()]
-    )
-    realm_default_language = forms.ChoiceField(choices=[])
+    realm_type = forms.TypedChoiceField(coerce=int, choices=ORG_TYPE_CHOICES)
+    # Django evaluates callable choices lazily, so the language list
+    # isn't read at import time.
+    realm_default_language = forms.ChoiceField(choices=get_language_choices)
     realm_name = forms.CharField(max_length=Realm.MAX_REALM_NAME_LENGTH)
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -149,9 +210,6 @@ class RealmDetailsForm(forms.Form):
         del kwargs["realm_creation"]
 
         super().__init__(*args, **kwargs)
-        self.fields["realm_default_language"] = forms.ChoiceField(
-            choices=[(lang["code"], lang["name"]) for lang in get_language_list()],
-        )
 
     def clean_realm_subdomain(self) -> str:
         if not self.realm_creation:
@@ -178,8 +236,15 @@ class RegistrationForm(RealmDetailsForm):
         required=False,
         coerce=int,
         empty_value=None,
-        choices=list(UserProfile.EMAIL_ADDRESS_VISIBILITY_ID_TO_NAME_MAP.items()),
+        choices=EMAIL_ADDRESS_VISIBILITY_CHOICES,
+    )
+    how_realm_creator_found_zulip = forms.ChoiceField(choices=HOW_REALM_CREATOR_FOUND_ZULIP_CHOICES)
+    how_realm_creator_found_zulip_other_text = forms.CharField(max_length=100, required=False)
+    how_realm_creator_found_zulip_where_ad = forms.CharField(max_length=100, required=False)
+    how_realm_creator_found_zulip_which_organization = forms.CharField(
+        max_length=100, required=False
     )
+    how_realm_creator_found_zulip_review_site = forms.CharField(max_length=100, required=False)
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         # Since the superclass doesn't except random extra kwargs, we
@@ -190,34 +255,16 @@ class RegistrationForm(RealmDetailsForm):
         super().__init__(*args, **kwargs)
         if settings.TERMS_OF_SERVICE_VERSION is not None:
             self.fields["terms"] = forms.BooleanField(required=True)
-        self.fields["realm_name"] = forms.CharField(
-            max_length=Realm.MAX_REALM_NAME_LENGTH, required=self.realm_creation
-        )
-        self.fields["realm_type"] = forms.TypedChoiceField(
-            coerce=int,
-            choices=[(t["id"], t["name"]) for t in Realm.ORG_TYPES.values()],
-            required=self.realm_creation,
-        )
-        self.fields["realm_default_language"] = forms.ChoiceField(
-            choices=[(lang["code"], lang["name"]) for lang in get_language_list()],
-            required=self.realm_creation,
-        )
-        self.fields["how_realm_creator_found_zulip"] = forms.ChoiceField(
-            choices=RealmAuditLog.HOW_REALM_CREATOR_FOUND_ZULIP_OPTIONS.items(),
-            required=self.realm_creation,
-        )
-        self.fields["how_realm_creator_found_zulip_other_text"] = forms.CharField(
-            max_length=100, required=False
-        )
-        self.fields["how_realm_creator_found_zulip_where_ad"] = forms.CharField(
-            max_length=100, required=False
-        )
-        self.fields["how_realm_creator_found_zulip_which_organization"] = forms.CharField(
-            max_length=100, required=False
-        )
-        self.fields["how_realm_creator_found_zulip_review_site"] = forms.CharField(
-            max_length=100, required=False
-        )
+        # The realm details are only required when creating a realm.
+        # We adjust the declared fields (which Django has already
+        # copied for this instance), rather than constructing new ones.
+        for field_name in [
+            "realm_name",
+            "realm_type",
+            "realm_default_language",
+            "how_realm_creator_found_zulip",
+        ]:
+            self.fields[field_name].required = self.realm_creation
 
     def clean_full_name(self) -> str:
         try:
@@ -244,7 +291,7 @@ class ToSForm(forms.Form):
         required=False,
         coerce=int,
         empty_value=None,
-        choices=list(UserProfile.EMAIL_ADDRESS_VISIBILITY_ID_TO_NAME_MAP.items()),
+        choices=EMAIL_ADDRESS_VISIBILITY_CHOICES,
     )
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -307,9 +354,6 @@ class HomepageForm(forms.Form):
                 _("Email addresses containing + are not allowed in this organization.")
             )
 
-        if realm.is_zephyr_mirror_realm:
-            email_is_not_mit_mailing_list(email)
-
         if settings.BILLING_ENABLED:
             from corporate.lib.registration import (
                 check_spare_licenses_available_for_registering_new_user,
@@ -327,6 +371,10 @@ class HomepageForm(forms.Form):
                     )
                 )
 
+        # This requires a DNS lookup, so we do it last.
+        if realm.is_zephyr_mirror_realm:
+            email_is_not_mit_mailing_list(email)
+
         return email
 
 
@@ -351,6 +399,18 @@ class RealmCreationForm(RealmDetailsForm):
         return self.cleaned_data["import_from"] or "none"
 
 
+@lru_cache(None)
+def get_altcha_widget_strings(language: str) -> str:
+    # The language argument is the cache key; the translations
+    # themselves come from the active language.
+    return orjson.dumps(
+        {
+            "verified": _("Verified that you're a human user!"),
+            "verifying": _("Verifying that you're not a bot…"),
+        }
+    ).decode()
+
+
 class AltchaWidget(forms.TextInput):
     @override
     def render(
@@ -374,12 +434,7 @@ class AltchaWidget(forms.TextInput):
                 ">"
             ),
             "--altcha-max-width: 300px;",
-            orjson.dumps(
-                {
-                    "verified": _("Verified that you're a human user!"),
-                    "verifying": _("Verifying that you're not a bot…"),
-                }
-            ).decode(),
+            get_altcha_widget_strings(get_language()),
         )
 
 
@@ -406,6 +461,33 @@ class CaptchaRealmCreationForm(RealmCreationForm):
         if not settings.USING_CAPTCHA or not settings.ALTCHA_HMAC_KEY:  # nocoverage
             raise forms.ValidationError(_("Challenges are not enabled."))
 
+        try:
+            rate_limit_request_by_ip(self.request, domain="realm_creation_captcha_by_ip")
+        except RateLimitedError:
+            logging.info(
+                "Too many realm creation CAPTCHA attempts from %s", self.request.META["REMOTE_ADDR"]
+            )
+            raise forms.ValidationError(
+                _("You're making too many attempts. Please try again later.")
+            )
+
+        # Check that the challenge is one we issued to this session
+        # before paying for verifying the solution.
+        try:
+            decoded_payload = orjson.loads(base64.b64decode(payload))
+            challenge = decoded_payload["challenge"]
+        except (ValueError, TypeError, KeyError):
+            logging.warning("Invalid altcha payload")
+            raise forms.ValidationError(_("Validation failed, please try again."))
+        if not isinstance(challenge, str):
+            logging.warning("Invalid altcha payload")
+            raise forms.ValidationError(_("Validation failed, please try again."))
+
+        session_challenges = get_session_altcha_challenges(self.request.session)
+        if challenge not in session_challenges:
+            logging.warning("Expired or replayed altcha solution")
+            raise forms.ValidationError(_("Validation failed, please try again."))
+
         try:
             ok, err = verify_solution(payload, settings.ALTCHA_HMAC_KEY, check_expires=True)
             if not ok:
@@ -417,19 +499,11 @@ class CaptchaRealmCreationForm(RealmCreationForm):
             logging.exception(e)
             raise forms.ValidationError(_("Validation failed, please try again."))
 
-        payload = orjson.loads(base64.b64decode(payload))
-        challenge = payload["challenge"]
-        session_challenges = [e[0] for e in self.request.session.get("altcha_challenges", [])]
-        if challenge not in session_challenges:
-            logging.warning("Expired or replayed altcha solution")
-            raise forms.ValidationError(_("Validation failed, please try again."))
-
         # Remove the successful solve from the session, to prevent replay
-        self.request.session["altcha_challenges"] = [
-            e for e in self.request.session.get("altcha_challenges", []) if e[0] != challenge
-        ]
+        del session_challenges[challenge]
+        self.request.session["altcha_challenges"] = session_challenges
 
-        return payload
+        return decoded_payload
 
 
 class LoggingSetPasswordForm(SetPasswordForm[UserProfile]):
@@ -499,19 +573,34 @@ class ZulipPasswordResetForm(PasswordResetForm):
                 "Password reset attempted for %s even though password auth is disabled.", email
             )
             return
+
+        if realm.deactivated:
+            logging.info("Realm is deactivated")
+            return
+
+        # Apply the per-email limit before checking LDAP, since that may
+        # require a query to the LDAP directory.
+        if settings.RATE_LIMITING:
+            try:
+                rate_limit_password_reset_form_by_email(email)
+            except RateLimitedError:
+                logging.info(
+                    "Too many password reset attempts for email %s from %s",
+                    email,
+                    request.META["REMOTE_ADDR"],
+                )
+                # The view will handle the RateLimit exception and render an appropriate page
+                raise
+
         if email_belongs_to_ldap(realm, email):
             # TODO: Ideally, we'd provide a user-facing error here
             # about the fact that they aren't allowed to have a
             # password in the Zulip server and should change it in LDAP.
             logging.info("Password reset not allowed for user in LDAP domain")
             return
-        if realm.deactivated:
-            logging.info("Realm is deactivated")
-            return
 
         if settings.RATE_LIMITING:
             try:
-                rate_limit_password_reset_form_by_email(email)
                 rate_limit_request_by_ip(request, domain="sends_email_by_ip")
             except RateLimitedError:
                 logging.info(
@@ -519,7 +608,6 @@ class ZulipPasswordResetForm(PasswordResetForm):
                     email,
                     request.META["REMOTE_ADDR"],
                 )
-                # The view will handle the RateLimit exception and render an appropriate page
                 raise
 
         try:
@@ -589,10 +677,16 @@ class OurAuthenticationForm(AuthenticationForm):
                 )
                 raise ValidationError(error_message.format(seconds=secs_to_freedom))
 
-            if return_data.get("inactive_realm"):
+            inactive_realm = return_data.get("inactive_realm")
+            password_reset_needed = return_data.get("password_reset_needed")
+            inactive_user = return_data.get("inactive_user")
+            is_mirror_dummy = return_data.get("is_mirror_dummy")
+            invalid_subdomain = return_data.get("invalid_subdomain")
+
+            if inactive_realm:
                 raise AssertionError("Programming error: inactive realm in authentication form")
 
-            if return_data.get("password_reset_needed"):
+            if password_reset_needed:
                 raise ValidationError(
                     _(
                         "Your password has been disabled because it is too weak. "
@@ -600,14 +694,14 @@ class OurAuthenticationForm(AuthenticationForm):
                     )
                 )
 
-            if return_data.get("inactive_user") and not return_data.get("is_mirror_dummy"):
+            if inactive_user and not is_mirror_dummy:
                 # We exclude mirror dummy accounts here. They should be treated as the
                 # user never having had an account, so we let them fall through to the
                 # normal invalid_login case below.
                 error_message = DEACTIVATED_ACCOUNT_ERROR.format(username=username)
                 raise ValidationError(error_message)
 
-            if return_data.get("invalid_subdomain"):
+            if invalid_subdomain:
                 self.logger.info(
                     "User attempted password login to wrong subdomain %s. Matching accounts: %s",
                     subdomain,
@@ -648,34 +742,46 @@ class AuthenticationTokenForm(TwoFactorAuthenticationTokenForm):
 
 
 class MultiEmailField(forms.Field):
+    def __init__(self, *, max_emails: int | None = None, **kwargs: Any) -> None:
+        self.max_emails = max_emails
+        super().__init__(**kwargs)
+
     @override
     def to_python(self, emails: str | None) -> list[str]:
-        """Normalize data to a list of strings."""
+        """Normalize data to a list of strings, dropping empty entries
+        and case-insensitive duplicates."""
         if not emails:
             return []
 
-        return [email.strip() for email in emails.split(",")]
+        seen: set[str] = set()
+        result: list[str] = []
+        for part in emails.split(","):
+            email = part.strip()
+            if email and email.lower() not in seen:
+                seen.add(email.lower())
+                result.append(email)
+        return result
 
     @override
     def validate(self, emails: list[str]) -> None:
         """Check if value consists only of valid emails."""
         super().validate(emails)
+        # Check the count first, so that we don't validate each
+        # address of a submission we're going to reject anyway.
+        if self.max_emails is not None and len(emails) > self.max_emails:
+            raise forms.ValidationError(
+                _("Please enter at most {max_emails} emails.").format(max_emails=self.max_emails)
+            )
         for email in emails:
             validate_email(email)
 
 
 class FindMyTeamForm(forms.Form):
     emails = MultiEmailField(
-        help_text=_("Tip: You can enter multiple email addresses with commas between them.")
+        max_emails=10,
+        help_text=_("Tip: You can enter multiple email addresses with commas between them."),
     )
 
-    def clean_emails(self) -> list[str]:
-        emails = self.cleaned_data["emails"]
-        if len(emails) > 10:
-            raise forms.ValidationError(_("Please enter at most 10 emails."))
-
-        return emails
-
 
 class RealmRedirectForm(forms.Form):
     subdomain = forms.CharField(max_length=Realm.MAX_REALM_SUBDOMAIN_LENGTH, required=True)
@@ -2,10 +2,9 @@ import configparser
 import importlib
 import os
 from collections import defaultdict
+from collections.abc import Mapping
 
 from django.conf import settings
-from django.db.models import F, Sum
-from django.db.models.functions import Length
 
 from zerver.models import BotConfigData, UserProfile
 
@@ -31,38 +30,43 @@ def get_bot_configs(bot_profile_ids: list[int]) -> dict[int, dict[str, str]]:
     return entries_by_uid
 
 
-def get_bot_config_size(bot_profile: UserProfile, key: str | None = None) -> int:
-    if key is None:
-        return (
-            BotConfigData.objects.filter(bot_profile=bot_profile)
-            .annotate(key_size=Length("key"), value_size=Length("value"))
-            .aggregate(sum=Sum(F("key_size") + F("value_size")))["sum"]
-            or 0
-        )
-    else:
-        try:
-            return len(key) + len(BotConfigData.objects.get(bot_profile=bot_profile, key=key).value)
-        except BotConfigData.DoesNotExist:
-            return 0
+def set_bot_config(bot_profile: UserProfile, key: str, value: str) -> None:
+    bulk_set_bot_config(bot_profile, {key: value})
 
 
-def set_bot_config(bot_profile: UserProfile, key: str, value: str) -> None:
+def bulk_set_bot_config(bot_profile: UserProfile, config_data: Mapping[str, str]) -> None:
+    if not config_data:
+        return
+
+    # Bot configurations are small (bounded by BOT_CONFIG_SIZE_LIMIT),
+    # so we fetch the whole thing once and compute the new size in
+    # Python, rather than querying once per key.
+    existing_entries = {
+        entry.key: entry for entry in BotConfigData.objects.filter(bot_profile=bot_profile)
+    }
     config_size_limit = settings.BOT_CONFIG_SIZE_LIMIT
-    old_entry_size = get_bot_config_size(bot_profile, key)
-    new_entry_size = len(key) + len(value)
-    old_config_size = get_bot_config_size(bot_profile)
-    new_config_size = old_config_size + (new_entry_size - old_entry_size)
+    new_config_size = sum(
+        len(key) + len(entry.value)
+        for key, entry in existing_entries.items()
+        if key not in config_data
+    ) + sum(len(key) + len(value) for key, value in config_data.items())
     if new_config_size > config_size_limit:
         raise ConfigError(
             f"Cannot store configuration. Request would require {new_config_size} characters. "
             f"The current configuration size limit is {config_size_limit} characters."
         )
-    obj, created = BotConfigData.objects.get_or_create(
-        bot_profile=bot_profile, key=key, defaults={"value": value}
-    )
-    if not created:
-        obj.value = value
-        obj.save()
+
+    entries_to_create = []
+    entries_to_update = []
+    for key, value in config_data.items():
+        if key in existing_entries:
+            entry = existing_entries[key]
+            entry.value = value
+            entries_to_update.append(entry)
+        else:
+            entries_to_create.append(BotConfigData(bot_profile=bot_profile, key=key, value=value))
+    BotConfigData.objects.bulk_create(entries_to_create)
+    BotConfigData.objects.bulk_update(entries_to_update, ["value"])
 
 
 def load_bot_config_template(bot: str) -> dict[str, str]:
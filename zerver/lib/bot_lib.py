@@ -20,7 +20,7 @@ from zerver.lib.bot_storage import (
     remove_bot_storage,
     set_bot_storage,
 )
-from zerver.lib.integrations import EMBEDDED_BOTS
+from zerver.lib.integrations import EMBEDDED_BOT_NAMES
 from zerver.lib.topic import get_topic_from_message_info
 from zerver.models import UserProfile
 from zerver.models.users import get_active_user
@@ -28,13 +28,9 @@ from zerver.models.users import get_active_user
 
 def get_bot_handler(service_name: str) -> Any:
     # Check that this service is present in EMBEDDED_BOTS, add exception handling.
-    configured_service = ""
-    for embedded_bot_service in EMBEDDED_BOTS:
-        if service_name == embedded_bot_service.name:
-            configured_service = embedded_bot_service.name
-    if not configured_service:
+    if service_name not in EMBEDDED_BOT_NAMES:
         return None
-    bot_module_name = f"zulip_bots.bots.{configured_service}.{configured_service}"
+    bot_module_name = f"zulip_bots.bots.{service_name}.{service_name}"
     bot_module: Any = importlib.import_module(bot_module_name)
     return bot_module.handler_class()
 
@@ -397,6 +397,7 @@ EMBEDDED_BOTS: list[EmbeddedBotIntegration] = [
     EmbeddedBotIntegration("giphy", []),
     EmbeddedBotIntegration("followup", []),
 ]
+EMBEDDED_BOT_NAMES = frozenset(bot.name for bot in EMBEDDED_BOTS)
 
 WEBHOOK_INTEGRATIONS: list[WebhookIntegration] = [
     WebhookIntegration("airbrake", ["monitoring"]),
@@ -21,8 +21,6 @@ def is_reserved_subdomain(subdomain: str) -> bool:
 
 
 def is_disposable_domain(domain: str) -> bool:
-    if domain.lower() in OVERRIDE_ALLOW_EMAIL_DOMAINS:
-        return False
     return domain.lower() in DISPOSABLE_DOMAINS
 
 
@@ -369,8 +367,6 @@ GENERIC_RESERVED_SUBDOMAINS = {
     "xoxo",
 }
 
-DISPOSABLE_DOMAINS = set(blocklist)
-
 OVERRIDE_ALLOW_EMAIL_DOMAINS = {
     "airsi.de",
     # Controlled by https://www.abine.com; more legitimate than most
@@ -380,3 +376,7 @@ OVERRIDE_ALLOW_EMAIL_DOMAINS = {
     "blurmail.net",
     "maskmemail.com",
 }
+
+# Apply the overrides once at import time, so that checking a domain
+# is a single set lookup.
+DISPOSABLE_DOMAINS = frozenset(blocklist) - OVERRIDE_ALLOW_EMAIL_DOMAINS
@@ -105,6 +105,17 @@ def get_expirable_session_var(
     return value
 
 
+def get_session_altcha_challenges(session: SessionBase) -> dict[str, float]:
+    """Returns the outstanding altcha challenges issued to this session,
+    as a map from challenge to its expiry timestamp."""
+    challenges = session.get("altcha_challenges", {})
+    if isinstance(challenges, list):
+        # Sessions created before we switched to a dict stored a list
+        # of (challenge, expiry) pairs.
+        challenges = dict(challenges)
+    return challenges
+
+
 def narrow_request_user(
     request: HttpRequest, *, user_id: int | None = None
 ) -> UserProfile | AnonymousUser:
@@ -9,7 +9,7 @@ from typing import Any, TypedDict
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Q, QuerySet
+from django.db.models import Count, Q, QuerySet
 from django.db.models.functions import Upper
 from django.utils.translation import gettext as _
 from django_otp.middleware import is_verified
@@ -19,7 +19,11 @@ from zulip_bots.custom_exceptions import ConfigValidationError
 from zerver.lib.avatar import avatar_url, get_avatar_field, get_avatar_for_inaccessible_user
 from zerver.lib.cache import cache_with_key, get_cross_realm_dicts_key
 from zerver.lib.create_user import get_dummy_email_address_for_display_regex
-from zerver.lib.exceptions import JsonableError, OrganizationOwnerRequiredError
+from zerver.lib.exceptions import (
+    EmailAlreadyInUseError,
+    JsonableError,
+    OrganizationOwnerRequiredError,
+)
 from zerver.lib.string_validation import check_string_is_printable
 from zerver.lib.timestamp import timestamp_to_datetime
 from zerver.lib.timezone import canonicalize_timezone
@@ -51,6 +55,9 @@ from zerver.models.users import (
     is_cross_realm_bot_email,
 )
 
+# Matches names ending in e.g. `|15`; see check_full_name.
+AMBIGUOUS_MENTION_NAME_RE = re.compile(r"\|\d+$")
+
 
 def check_full_name(
     full_name_raw: str, *, user_profile: UserProfile | None, realm: Realm | None
@@ -68,7 +75,7 @@ def check_full_name(
     # sloppily-written parsers of our Markdown syntax for mentioning
     # users with ambiguous names, and likely have no real use, so we
     # ban them.
-    if re.search(r"\|\d+$", full_name_raw):
+    if AMBIGUOUS_MENTION_NAME_RE.search(full_name_raw):
         raise JsonableError(_("Invalid format!"))
 
     if require_unique_names(realm):
@@ -83,11 +90,12 @@ def check_full_name(
         else:
             existing_names = users_query.values_list("full_name", flat=True)
 
-        normalized_existing_names = [
-            unicodedata.normalize("NFKC", full_name).casefold() for full_name in existing_names
-        ]
-
-        if normalized_user_full_name in normalized_existing_names:
+        # Stop at the first collision, rather than normalizing every
+        # name in the realm up front.
+        if any(
+            unicodedata.normalize("NFKC", existing_name).casefold() == normalized_user_full_name
+            for existing_name in existing_names
+        ):
             raise JsonableError(_("Unique names required in this organization."))
 
     return full_name
@@ -113,6 +121,25 @@ def check_bot_name_available(realm_id: int, full_name: str, *, is_activation: bo
             raise JsonableError(_("Name is already in use."))
 
 
+def check_bot_email_and_name_available(realm_id: int, email: str, full_name: str) -> None:
+    # Combines the delivery email check done by get_user_by_delivery_email
+    # with check_bot_name_available into a single query.
+    email = email.strip()
+    full_name = full_name.strip()
+    conflicts = (
+        UserProfile.objects.filter(realm_id=realm_id)
+        .filter(Q(delivery_email__iexact=email) | Q(full_name=full_name, is_active=True))
+        .aggregate(
+            email_in_use=Count("id", filter=Q(delivery_email__iexact=email)),
+            name_in_use=Count("id", filter=Q(full_name=full_name, is_active=True)),
+        )
+    )
+    if conflicts["email_in_use"]:
+        raise EmailAlreadyInUseError
+    if conflicts["name_in_use"]:
+        raise JsonableError(_("Name is already in use."))
+
+
 def check_short_name(short_name_raw: str) -> str:
     short_name = short_name_raw.strip()
     if len(short_name) == 0:
@@ -260,9 +287,22 @@ def user_ids_to_users(
     return user_profiles
 
 
-def access_bot_by_id(user_profile: UserProfile, user_id: int) -> UserProfile:
+def access_bot_by_id(
+    user_profile: UserProfile, user_id: int, *, for_serialization: bool = False
+) -> UserProfile:
     try:
-        target = get_user_profile_by_id_in_realm(user_id, user_profile.realm)
+        if for_serialization:
+            # Callers that return the bot's settings to the client read
+            # these foreign keys, so fetch them along with the bot.
+            target = (
+                base_bulk_get_user_queryset()
+                .select_related(
+                    "default_sending_stream", "default_events_register_stream", "bot_owner"
+                )
+                .get(id=user_id, realm=user_profile.realm)
+            )
+        else:
+            target = get_user_profile_by_id_in_realm(user_id, user_profile.realm)
     except UserProfile.DoesNotExist:
         raise JsonableError(_("No such bot"))
     if not target.is_bot:
@@ -1134,6 +1174,12 @@ def get_users_for_api(
         # TODO: Consider optimizing this query away with caching.
         if target_user is not None:
             custom_profile_field_values = base_query.filter(user_profile=target_user)
+        elif user_ids is not None:
+            # Only fetch values for the requested users, rather than
+            # for everyone in the realm.
+            custom_profile_field_values = base_query.filter(
+                field__realm_id=realm.id, user_profile_id__in=user_ids
+            )
         else:
             custom_profile_field_values = base_query.filter(field__realm_id=realm.id)
         profiles_by_user_id = get_custom_profile_field_values(custom_profile_field_values)
@@ -1212,13 +1258,13 @@ def get_users_with_access_to_real_email(user_profile: UserProfile) -> list[int]:
 def max_message_id_for_user(user_profile: UserProfile | None) -> int:
     if user_profile is None:
         return -1
-    max_message = (
+    max_message_id = (
         UserMessage.objects.filter(user_profile=user_profile)
         .order_by("-message_id")
-        .only("message_id")
+        .values_list("message_id", flat=True)
         .first()
     )
-    if max_message:
-        return max_message.message_id
+    if max_message_id is not None:
+        return max_message_id
     else:
         return -1
@@ -1,5 +1,6 @@
 from email.headerregistry import Address
 from enum import Enum, IntEnum
+from functools import lru_cache
 from types import UnionType
 from typing import TYPE_CHECKING, Optional, TypedDict
 from uuid import uuid4
@@ -1372,6 +1373,14 @@ class InvalidFakeEmailDomainError(Exception):
 
 
 def get_fake_email_domain(realm_host: str) -> str:
+    return _get_fake_email_domain(realm_host, settings.FAKE_EMAIL_DOMAIN)
+
+
+# This is called for every dummy email address we generate, including
+# once per user in some bulk paths, and the answer only depends on the
+# realm host and FAKE_EMAIL_DOMAIN, so we cache the email validation.
+@lru_cache(maxsize=1024)
+def _get_fake_email_domain(realm_host: str, fake_email_domain: str) -> str:
     try:
         # Check that realm.host can be used to form valid email addresses.
         validate_email(Address(username="bot", domain=realm_host).addr_spec)
@@ -1381,14 +1390,14 @@ def get_fake_email_domain(realm_host: str) -> str:
 
     try:
         # Check that the fake email domain can be used to form valid email addresses.
-        validate_email(Address(username="bot", domain=settings.FAKE_EMAIL_DOMAIN).addr_spec)
+        validate_email(Address(username="bot", domain=fake_email_domain).addr_spec)
     except ValidationError:
         raise InvalidFakeEmailDomainError(
-            settings.FAKE_EMAIL_DOMAIN + " is not a valid domain. "
+            fake_email_domain + " is not a valid domain. "
             "Consider setting the FAKE_EMAIL_DOMAIN setting."
         )
 
-    return settings.FAKE_EMAIL_DOMAIN
+    return fake_email_domain
 
 
 class RealmExport(models.Model):
@@ -21,7 +21,8 @@ from zerver.lib.bot_lib import get_bot_handler
 from zerver.lib.integrations import EMBEDDED_BOTS, WebhookIntegration
 from zerver.lib.request import RequestNotes
 from zerver.lib.test_classes import UploadSerializeMixin, ZulipTestCase
-from zerver.lib.test_helpers import avatar_disk_path, get_test_image_file
+from zerver.lib.test_helpers import avatar_disk_path, get_test_image_file, queries_captured
+from zerver.lib.users import access_bot_by_id
 from zerver.lib.utils import assert_is_not_none
 from zerver.lib.webhooks.common import WebhookConfigOption
 from zerver.models import RealmUserDefault, Service, Subscription, UserProfile
@@ -166,6 +167,27 @@ class BotTest(ZulipTestCase, UploadSerializeMixin):
 
         self.assert_json_success(users_result)
 
+    def test_get_bots_query_count(self) -> None:
+        self.login("hamlet")
+        self.create_bot(default_sending_stream="Denmark")
+        with queries_captured() as queries:
+            result = self.client_get("/json/bots")
+        self.assertEqual(len(self.assert_json_success(result)["bots"]), 1)
+        num_queries_with_one_bot = len(queries)
+
+        for i in range(3):
+            self.create_bot(
+                full_name=f"Bot {i}",
+                short_name=f"bot-{i}",
+                default_sending_stream="Denmark",
+                default_events_register_stream="Denmark",
+            )
+
+        # Listing bots should not issue per-bot queries.
+        with self.assert_database_query_count(num_queries_with_one_bot):
+            result = self.client_get("/json/bots")
+        self.assertEqual(len(self.assert_json_success(result)["bots"]), 4)
+
     def test_add_bot(self) -> None:
         hamlet = self.example_user("hamlet")
         self.login("hamlet")
@@ -295,6 +317,23 @@ class BotTest(ZulipTestCase, UploadSerializeMixin):
         self.assert_json_error(result, "You may only upload one file at a time")
         self.assert_num_bots_equal(0)
 
+    def test_add_bot_with_invalid_avatar(self) -> None:
+        self.login("hamlet")
+        self.assert_num_bots_equal(0)
+        # A failed avatar upload rolls back the whole bot, and no
+        # bot_add event is sent for it.
+        with (
+            get_test_image_file("corrupt.png") as fp,
+            self.capture_send_event_calls(expected_num_events=0),
+        ):
+            result = self.client_post(
+                "/json/bots",
+                dict(full_name="The Bot of Hamlet", short_name="hambot", file=fp),
+            )
+        self.assert_json_error(result, "Could not decode image; did you upload an image file?")
+        self.assert_num_bots_equal(0)
+        self.assertFalse(UserProfile.objects.filter(email="hambot-bot@zulip.testserver").exists())
+
     def test_add_bot_with_default_sending_stream(self) -> None:
         email = "hambot-bot@zulip.testserver"
         realm = get_realm("zulip")
@@ -1203,6 +1242,20 @@ class BotTest(ZulipTestCase, UploadSerializeMixin):
         bot = self.get_bot()
         self.assertEqual("The Bot of Hamlet", bot["full_name"])
 
+    def test_access_bot_by_id_for_serialization(self) -> None:
+        hamlet = self.example_user("hamlet")
+        self.login_user(hamlet)
+        self.create_bot(default_sending_stream="Denmark")
+        bot_user = self.get_bot_user("hambot-bot@zulip.testserver")
+
+        bot = access_bot_by_id(hamlet, bot_user.id, for_serialization=True)
+        with self.assert_database_query_count(0):
+            assert bot.default_sending_stream is not None
+            self.assertEqual(bot.default_sending_stream.name, "Denmark")
+            self.assertIsNone(bot.default_events_register_stream)
+            assert bot.bot_owner is not None
+            self.assertEqual(bot.bot_owner.id, hamlet.id)
+
     def test_patch_bot_owner_bad_user_id(self) -> None:
         self.login("hamlet")
         self.create_bot()
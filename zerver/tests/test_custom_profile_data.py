@@ -437,6 +437,27 @@ class DeleteCustomProfileFieldTest(CustomProfileFieldTestCase):
         )
         self.assert_json_success(result)
 
+        # Several values can be removed in a single request.
+        phone_field = CustomProfileField.objects.get(name="Phone number", realm=realm)
+        data = [
+            {"id": field.id, "value": [self.example_user("aaron").id]},
+            {"id": phone_field.id, "value": "123456"},
+        ]
+        do_update_user_custom_profile_data_if_changed(iago, data)
+        with self.capture_send_event_calls(expected_num_events=2):
+            result = self.client_delete(
+                "/json/users/me/profile_data",
+                {
+                    "data": orjson.dumps([field.id, phone_field.id]).decode(),
+                },
+            )
+        self.assert_json_success(result)
+        self.assertFalse(
+            CustomProfileFieldValue.objects.filter(
+                user_profile=iago, field_id__in=[field.id, phone_field.id]
+            ).exists()
+        )
+
     def test_delete_internals(self) -> None:
         user_profile = self.example_user("iago")
         realm = user_profile.realm
@@ -1237,6 +1258,27 @@ class ListCustomProfileFieldTest(CustomProfileFieldTestCase):
         raw_user_data = self.assert_json_success(response)
         self.assertEqual(set(raw_user_data.keys()), expected_keys)
 
+    def test_get_custom_profile_fields_from_api_for_user_ids(self) -> None:
+        iago = self.example_user("iago")
+        hamlet = self.example_user("hamlet")
+        self.login_user(iago)
+        response = self.client_get(
+            "/json/users",
+            {
+                "include_custom_profile_fields": "true",
+                "user_ids": orjson.dumps([iago.id, hamlet.id]).decode(),
+            },
+        )
+        members = self.assert_json_success(response)["members"]
+        self.assertEqual({member["user_id"] for member in members}, {iago.id, hamlet.id})
+        for member in members:
+            field_ids = CustomProfileFieldValue.objects.filter(
+                user_profile_id=member["user_id"]
+            ).values_list("field_id", flat=True)
+            self.assertEqual(set(member["profile_data"].keys()), {str(id) for id in field_ids})
+            if member["user_id"] == iago.id:
+                self.assertNotEqual(member["profile_data"], {})
+
 
 class ReorderCustomProfileFieldTest(CustomProfileFieldTestCase):
     def test_reorder(self) -> None:
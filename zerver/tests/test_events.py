@@ -36,7 +36,7 @@ from zerver.actions.channel_folders import (
 )
 from zerver.actions.create_user import do_create_user, do_reactivate_user
 from zerver.actions.custom_profile_fields import (
-    check_remove_custom_profile_field_value,
+    check_remove_custom_profile_field_values,
     do_remove_realm_custom_profile_field,
     do_update_user_custom_profile_data_if_changed,
     try_add_realm_custom_profile_field,
@@ -1772,8 +1772,8 @@ class NormalActionsTest(BaseAction):
 
         # Test event for removing custom profile data
         with self.verify_action() as events:
-            check_remove_custom_profile_field_value(
-                self.user_profile, field_id, acting_user=self.user_profile
+            check_remove_custom_profile_field_values(
+                self.user_profile, [field_id], acting_user=self.user_profile
             )
         check_realm_user_update("events[0]", events[0], "custom_profile_field")
         self.assertEqual(events[0]["person"]["custom_profile_field"].keys(), {"id", "value"})
@@ -5,6 +5,7 @@ from contextlib import contextmanager
 from typing import IO, TYPE_CHECKING, Any
 from unittest import mock, skipUnless
 
+import dns.exception
 import dns.resolver
 import orjson
 from circuitbreaker import CircuitBreakerMonitor
@@ -77,6 +78,36 @@ class MITNameTest(ZulipTestCase):
         ):
             email_is_not_mit_mailing_list("sipbexch@mit.edu")
 
+    def test_mailinglist_lookup_cached(self) -> None:
+        with mock.patch("dns.resolver.resolve", side_effect=dns.resolver.NXDOMAIN) as m:
+            self.assertRaises(ValidationError, email_is_not_mit_mailing_list, "ec-discuss@mit.edu")
+            self.assertRaises(ValidationError, email_is_not_mit_mailing_list, "EC-discuss@mit.edu")
+        m.assert_called_once()
+
+    def test_mailinglist_lookup_timeout(self) -> None:
+        with mock.patch(
+            "dns.resolver.resolve",
+            side_effect=[
+                dns.exception.Timeout,
+                dns_txt_answer(
+                    "starnine.pobox.ns.athena.mit.edu.", "POP IMAP.EXCHANGE.MIT.EDU starnine"
+                ),
+            ],
+        ) as m:
+            email_is_not_mit_mailing_list("starnine@mit.edu")
+        self.assertEqual(m.call_count, 2)
+
+        with (
+            mock.patch("dns.resolver.resolve", side_effect=dns.exception.Timeout) as m,
+            self.assertLogs(level="WARNING") as warn_log,
+        ):
+            email_is_not_mit_mailing_list("sipbexch@mit.edu")
+        self.assertEqual(m.call_count, 3)
+        self.assertEqual(
+            warn_log.output,
+            ["WARNING:root:Timed out checking whether sipbexch@mit.edu is an MIT mailing list"],
+        )
+
 
 class RateLimitTests(ZulipTestCase):
     @override
@@ -11,7 +11,13 @@ from typing_extensions import ParamSpec, override
 
 from zerver.actions.create_user import do_create_user
 from zerver.actions.message_send import get_service_bot_events
-from zerver.lib.bot_config import ConfigError, load_bot_config_template, set_bot_config
+from zerver.lib.bot_config import (
+    ConfigError,
+    bulk_set_bot_config,
+    get_bot_config,
+    load_bot_config_template,
+    set_bot_config,
+)
 from zerver.lib.bot_lib import EmbeddedBotEmptyRecipientsListError, EmbeddedBotHandler, StateHandler
 from zerver.lib.bot_storage import StateError
 from zerver.lib.test_classes import ZulipTestCase
@@ -404,6 +410,27 @@ class TestServiceBotConfigHandler(ZulipTestCase):
             lambda: set_bot_config(self.bot_profile, "yet another key", "x"),
         )
 
+    @override_settings(BOT_CONFIG_SIZE_LIMIT=100)
+    def test_bulk_set_bot_config(self) -> None:
+        set_bot_config(self.bot_profile, "entry 1", "value 1")
+        with self.assert_database_query_count(3):
+            bulk_set_bot_config(self.bot_profile, {"entry 1": "new value", "entry 2": "value 2"})
+        self.assertEqual(
+            get_bot_config(self.bot_profile), {"entry 1": "new value", "entry 2": "value 2"}
+        )
+
+        self.assertRaisesMessage(
+            ConfigError,
+            "Cannot store configuration. Request would require 122 characters. "
+            "The current configuration size limit is 100 characters.",
+            lambda: bulk_set_bot_config(
+                self.bot_profile, {"entry 1": "x" * 50, "entry 3": "x" * 44}
+            ),
+        )
+        self.assertEqual(
+            get_bot_config(self.bot_profile), {"entry 1": "new value", "entry 2": "value 2"}
+        )
+
     def test_load_bot_config_template(self) -> None:
         bot_config = load_bot_config_template("giphy")
         self.assertTrue(isinstance(bot_config, dict))
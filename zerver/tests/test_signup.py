@@ -93,6 +93,7 @@ from zerver.models.realms import get_realm
 from zerver.models.recipients import get_direct_message_group_user_ids
 from zerver.models.streams import get_stream
 from zerver.models.users import get_system_bot, get_user, get_user_by_delivery_email
+from zerver.views.antispam import MAX_SESSION_ALTCHA_CHALLENGES
 from zerver.views.auth import redirect_and_log_into_subdomain, start_two_factor_auth
 from zerver.views.development.registration import confirmation_key
 from zproject.backends import ExternalAuthDataDict, ExternalAuthResult, email_auth_enabled
@@ -2200,11 +2201,18 @@ class RealmCreationTest(ZulipTestCase):
         self.assertFalse(is_root_domain_available())
 
     def test_subdomain_check_api(self) -> None:
-        result = self.client_get("/json/realm/subdomain/zulip")
+        result = self.client_get("/json/realm/subdomain/lear")
         self.assert_in_success_response(
             ["Subdomain is already in use. Please choose a different one."], result
         )
 
+        # Reserved subdomains are rejected before checking for
+        # existing realms.
+        result = self.client_get("/json/realm/subdomain/zulip")
+        self.assert_in_success_response(
+            ["Subdomain reserved. Please choose a different one."], result
+        )
+
         result = self.client_get("/json/realm/subdomain/zu_lip")
         self.assert_in_success_response(
             ["Subdomain can only have lowercase letters, numbers, and '-'s."], result
@@ -2260,6 +2268,45 @@ class RealmCreationTest(ZulipTestCase):
                 check_subdomain_available("we-are-zulip-team")
             check_subdomain_available("we-are-zulip-team", allow_reserved_subdomain=True)
 
+    @override_settings(OPEN_REALM_CREATION=True, USING_CAPTCHA=True, ALTCHA_HMAC_KEY="secret")
+    @ratelimit_rule(60, 1, domain="realm_creation_captcha_by_ip")
+    def test_create_realm_captcha_rate_limited(self) -> None:
+        payload = base64.b64encode(orjson.dumps({"challenge": "moose"})).decode()
+        with self.assertLogs(level="WARNING"):
+            result = self.submit_realm_creation_form(
+                "user1@test.com", realm_subdomain="custom-test", realm_name="Test", captcha=payload
+            )
+        self.assert_in_success_response(["Validation failed, please try again."], result)
+
+        with (
+            patch("zerver.forms.verify_solution") as verify,
+            self.assertLogs(level="INFO") as logs,
+        ):
+            result = self.submit_realm_creation_form(
+                "user1@test.com", realm_subdomain="custom-test", realm_name="Test", captcha=payload
+            )
+        self.assert_in_success_response(
+            ["making too many attempts. Please try again later."], result
+        )
+        verify.assert_not_called()
+        self.assertEqual(
+            logs.output, ["INFO:root:Too many realm creation CAPTCHA attempts from 127.0.0.1"]
+        )
+
+    def test_subdomain_check_query_count(self) -> None:
+        # Malformed and reserved subdomains are rejected without
+        # touching the database.
+        with self.assert_database_query_count(0), self.assertRaises(ValidationError):
+            check_subdomain_available("-ba_d-")
+        with self.assert_database_query_count(0), self.assertRaises(ValidationError):
+            check_subdomain_available("stream")
+
+        # Otherwise, a single query against the unique string_id index.
+        with self.assert_database_query_count(1):
+            check_subdomain_available("hufflepuff")
+        with self.assert_database_query_count(1), self.assertRaises(ValidationError):
+            check_subdomain_available("lear")
+
     @override_settings(OPEN_REALM_CREATION=True, USING_CAPTCHA=True, ALTCHA_HMAC_KEY="secret")
     def test_create_realm_with_captcha(self) -> None:
         string_id = "custom-test"
@@ -2286,7 +2333,7 @@ class RealmCreationTest(ZulipTestCase):
             )
             self.assert_in_success_response(["Validation failed, please try again."], result)
             self.assert_length(logs.output, 1)
-            self.assertIn("Invalid altcha solution: Invalid altcha payload", logs.output[0])
+            self.assertIn("Invalid altcha payload", logs.output[0])
 
         # With something which raises an exception, we also get the same error
         with self.assertLogs(level="WARNING") as logs:
@@ -2300,11 +2347,18 @@ class RealmCreationTest(ZulipTestCase):
             )
             self.assert_in_success_response(["Validation failed, please try again."], result)
             self.assert_length(logs.output, 1)
-            self.assertIn(
-                "TypeError: list indices must be integers or slices, not str", logs.output[0]
+            self.assertIn("Invalid altcha payload", logs.output[0])
+
+        payload = base64.b64encode(orjson.dumps({"challenge": ["moose"]})).decode()
+        with self.assertLogs(level="WARNING") as logs:
+            result = self.submit_realm_creation_form(
+                email, realm_subdomain=string_id, realm_name=realm_name, captcha=payload
             )
+            self.assert_in_success_response(["Validation failed, please try again."], result)
+            self.assertEqual(logs.output, ["WARNING:root:Invalid altcha payload"])
 
-        # If we override the validation, we get an error because it's not in the session
+        # A challenge which is not in the session is rejected before
+        # we verify the solution.
         payload = base64.b64encode(orjson.dumps({"challenge": "moose"})).decode()
         with (
             patch("zerver.forms.verify_solution", return_value=(True, None)) as verify,
@@ -2314,7 +2368,7 @@ class RealmCreationTest(ZulipTestCase):
                 email, realm_subdomain=string_id, realm_name=realm_name, captcha=payload
             )
             self.assert_in_success_response(["Validation failed, please try again."], result)
-            verify.assert_called_once_with(payload, "secret", check_expires=True)
+            verify.assert_not_called()
             self.assert_length(logs.output, 1)
             self.assertIn("Expired or replayed altcha solution", logs.output[0])
 
@@ -2328,11 +2382,44 @@ class RealmCreationTest(ZulipTestCase):
         self.assertIn("salt", data)
 
         self.assert_length(self.client.session["altcha_challenges"], 1)
-        self.assertEqual(self.client.session["altcha_challenges"][0][0], data["challenge"])
+        self.assertIn(data["challenge"], self.client.session["altcha_challenges"])
 
         # Update the payload so the challenge matches what is in the
         # session.  The real payload would have other keys.
         payload = base64.b64encode(orjson.dumps({"challenge": data["challenge"]})).decode()
+
+        # A challenge from the session with a bad solution fails
+        # verification, and stays in the session.
+        bad_solution = base64.b64encode(
+            orjson.dumps(
+                {
+                    "algorithm": data["algorithm"],
+                    "challenge": data["challenge"],
+                    "number": 0,
+                    "salt": data["salt"],
+                    "signature": "wrong",
+                }
+            )
+        ).decode()
+        with self.assertLogs(level="WARNING") as logs:
+            result = self.submit_realm_creation_form(
+                email, realm_subdomain=string_id, realm_name=realm_name, captcha=bad_solution
+            )
+            self.assert_in_success_response(["Validation failed, please try again."], result)
+            self.assert_length(logs.output, 1)
+            self.assertIn("Invalid altcha solution", logs.output[0])
+
+        with (
+            patch("zerver.forms.verify_solution", side_effect=ValueError("bad")),
+            self.assertLogs(level="WARNING") as logs,
+        ):
+            result = self.submit_realm_creation_form(
+                email, realm_subdomain=string_id, realm_name=realm_name, captcha=payload
+            )
+            self.assert_in_success_response(["Validation failed, please try again."], result)
+            self.assert_length(logs.output, 1)
+            self.assertIn("ValueError: bad", logs.output[0])
+
         with patch("zerver.forms.verify_solution", return_value=(True, None)) as verify:
             result = self.submit_realm_creation_form(
                 email, realm_subdomain=string_id, realm_name=realm_name, captcha=payload
@@ -2341,7 +2428,35 @@ class RealmCreationTest(ZulipTestCase):
             verify.assert_called_once_with(payload, "secret", check_expires=True)
 
         # And the challenge has been stripped out of the session
-        self.assertEqual(self.client.session["altcha_challenges"], [])
+        self.assertEqual(self.client.session["altcha_challenges"], {})
+
+    @override_settings(USING_CAPTCHA=True, ALTCHA_HMAC_KEY="secret")
+    def test_antispam_challenge_legacy_session_format(self) -> None:
+        # Sessions from before challenges were stored as a dict hold a
+        # list of (challenge, expiry) pairs.
+        session = self.client.session
+        session["altcha_challenges"] = [
+            ["expired", time.time() - 10],
+            ["current", time.time() + 60],
+        ]
+        session.save()
+
+        result = self.client_get("/json/antispam_challenge")
+        data = self.assert_json_success(result)
+        self.assertEqual(
+            set(self.client.session["altcha_challenges"]), {"current", data["challenge"]}
+        )
+
+    @override_settings(USING_CAPTCHA=True, ALTCHA_HMAC_KEY="secret")
+    def test_antispam_challenge_session_bounded(self) -> None:
+        challenges = []
+        for _ in range(MAX_SESSION_ALTCHA_CHALLENGES + 2):
+            result = self.client_get("/json/antispam_challenge")
+            challenges.append(self.assert_json_success(result)["challenge"])
+        self.assertEqual(
+            list(self.client.session["altcha_challenges"]),
+            challenges[-MAX_SESSION_ALTCHA_CHALLENGES:],
+        )
 
 
 class UserSignUpTest(ZulipTestCase):
@@ -3170,7 +3285,7 @@ class UserSignUpTest(ZulipTestCase):
         Check that when we give invalid subdomain and submit the registration form
         all the values in the form are preserved.
         """
-        realm = get_realm("zulip")
+        realm = get_realm("lear")
 
         email = self.example_email("iago")
         realm_name = "Test"
@@ -4767,6 +4882,14 @@ class TestFindMyTeam(ZulipTestCase):
 
         self.assert_length(outbox, 0)
 
+    def test_find_team_ignores_empty_and_duplicate_entries(self) -> None:
+        data = {"emails": "hamlet@zulip.com, ,Hamlet@zulip.com,hamlet@zulip.com,"}
+        result = self.client_post("/accounts/find/", data)
+        self.assertEqual(result.status_code, 200)
+        from django.core.mail import outbox
+
+        self.assert_length(outbox, 1)
+
     def test_find_team_one_email(self) -> None:
         data = {"emails": self.example_email("hamlet")}
         result = self.client_post("/accounts/find/", data)
@@ -4823,6 +4946,13 @@ class TestFindMyTeam(ZulipTestCase):
 
         self.assert_length(outbox, 0)
 
+        # Duplicates don't count towards the limit.
+        data = {"emails": ",".join(["hamlet@zulip.com"] * 11)}
+        result = self.client_post("/accounts/find/", data)
+        self.assertEqual(result.status_code, 200)
+        self.assertNotIn("Please enter at most 10", result.content.decode())
+        self.assert_length(outbox, 1)
+
 
 class ConfirmationKeyTest(ZulipTestCase):
     def test_confirmation_key(self) -> None:
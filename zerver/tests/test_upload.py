@@ -1271,6 +1271,7 @@ class AvatarTest(UploadSerializeMixin, ZulipTestCase):
             response = self.client_get("/avatar/cordelia@zulip.com", {"foo": "bar"})
             redirect_url = response["Location"]
             self.assertEqual(redirect_url, str(avatar_url(cordelia)) + "&foo=bar")
+            self.assertEqual(response["Cache-Control"], "private, max-age=60")
 
         with self.settings(
             ENABLE_GRAVATAR=False, GRAVATAR_REALM_OVERRIDE={get_realm("zulip").id: True}
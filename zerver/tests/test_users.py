@@ -9,8 +9,10 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sessions.models import Session
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.test import override_settings
 from django.utils.timezone import now as timezone_now
+from typing_extensions import override
 
 from confirmation.models import Confirmation
 from corporate.lib.stripe import get_latest_seat_count
@@ -43,6 +45,7 @@ from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import (
     get_subscription,
     get_test_image_file,
+    queries_captured,
     reset_email_visibility_to_everyone_in_zulip_realm,
     simulated_empty_cache,
 )
@@ -79,7 +82,12 @@ from zerver.models.custom_profile_fields import check_valid_user_ids
 from zerver.models.groups import SystemGroups
 from zerver.models.prereg_users import filter_to_valid_prereg_users
 from zerver.models.realm_audit_logs import AuditLogEventType
-from zerver.models.realms import InvalidFakeEmailDomainError, get_fake_email_domain, get_realm
+from zerver.models.realms import (
+    InvalidFakeEmailDomainError,
+    _get_fake_email_domain,
+    get_fake_email_domain,
+    get_realm,
+)
 from zerver.models.streams import get_stream
 from zerver.models.users import (
     get_source_profile,
@@ -418,6 +426,15 @@ class PermissionTest(ZulipTestCase):
         hamlet = self.example_user("hamlet")
         self.assertEqual(hamlet.full_name, new_name)
 
+    def test_admin_unchanged_full_name_skips_validation(self) -> None:
+        self.login("iago")
+        hamlet = self.example_user("hamlet")
+        req = dict(full_name=f"  {hamlet.full_name} ")
+        with mock.patch("zerver.views.users.check_full_name") as mock_check_full_name:
+            result = self.client_patch(f"/json/users/{hamlet.id}", req)
+        self.assert_json_success(result)
+        mock_check_full_name.assert_not_called()
+
     def test_non_admin_cannot_change_full_name(self) -> None:
         self.login("hamlet")
         req = dict(full_name="new name")
@@ -833,6 +850,23 @@ class PermissionTest(ZulipTestCase):
         )
         self.assert_json_error(result, "Field id 9001 not found.")
 
+        # The invalid field is rejected before the other requested
+        # changes are written.
+        with queries_captured() as queries:
+            result = self.client_patch(
+                f"/json/users/{cordelia.id}",
+                {
+                    "full_name": "New Cordelia",
+                    "role": orjson.dumps(UserProfile.ROLE_MODERATOR).decode(),
+                    "profile_data": orjson.dumps(invalid_profile_data).decode(),
+                },
+            )
+        self.assert_json_error(result, "Field id 9001 not found.")
+        self.assertFalse(any(query.sql.startswith(("UPDATE", "DELETE")) for query in queries))
+        cordelia.refresh_from_db()
+        self.assertEqual(cordelia.full_name, "Cordelia, Lear's daughter")
+        self.assertEqual(cordelia.role, UserProfile.ROLE_MEMBER)
+
         # non-existent field and data
         invalid_profile_data = [
             {
@@ -1193,6 +1227,23 @@ class AdminChangeUserEmailTest(ZulipTestCase):
         )
         self.assert_json_error(result, "Invalid new email address.")
 
+        # An invalid email is rejected before any of the other requested
+        # changes are written.
+        with queries_captured() as queries:
+            result = self.client_patch(
+                f"/json/users/{cordelia.id}",
+                dict(
+                    full_name="New Cordelia",
+                    role=orjson.dumps(UserProfile.ROLE_MODERATOR).decode(),
+                    new_email="invalid",
+                ),
+            )
+        self.assert_json_error(result, "Invalid new email address.")
+        self.assertFalse(any(query.sql.startswith("UPDATE") for query in queries))
+        cordelia.refresh_from_db()
+        self.assertEqual(cordelia.full_name, "Cordelia, Lear's daughter")
+        self.assertEqual(cordelia.role, UserProfile.ROLE_MEMBER)
+
         result = self.client_patch(
             f"/json/users/{UserProfile.objects.latest('id').id + 1}",
             dict(new_email="new@zulip.com"),
@@ -1330,6 +1381,31 @@ class AdminCreateUserTest(ZulipTestCase):
         result = self.client_post("/json/users", valid_params)
         self.assert_json_error(result, "Email is already in use.")
 
+        # The check is case-insensitive.
+        result = self.client_post(
+            "/json/users", {**valid_params, "email": valid_params["email"].upper()}
+        )
+        self.assert_json_error(result, "Email is already in use.")
+
+        # The password strength is checked before we try to create the
+        # user, so a weak password is reported even for a taken address.
+        with self.settings(PASSWORD_MIN_LENGTH=6, PASSWORD_MIN_GUESSES=1000):
+            result = self.client_post("/json/users", valid_params)
+        self.assert_json_error(result, "The password is too weak.")
+
+        # Other integrity errors aren't reported as a duplicate email.
+        with (
+            mock.patch("zerver.views.users.do_create_user", side_effect=IntegrityError),
+            self.assertRaises(IntegrityError),
+        ):
+            self.client_post("/json/users", {**valid_params, "email": "juliet@zulip.net"})
+
+        # Whitespace around the email address is ignored.
+        result = self.client_post("/json/users", {**valid_params, "email": " juliet@zulip.net "})
+        self.assert_json_success(result)
+        new_user = get_user_by_delivery_email("juliet@zulip.net", get_realm("zulip"))
+        self.assertEqual(new_user.delivery_email, "juliet@zulip.net")
+
         # Don't allow user to sign up with disposable email.
         realm.emails_restricted_to_domains = False
         realm.disallow_disposable_email_addresses = True
@@ -1770,6 +1846,13 @@ class UserProfileTest(ZulipTestCase):
         )
         self.assertFalse(result["is_subscribed"])
 
+        self.subscribe(iago, stream.name)
+        result = orjson.loads(
+            self.client_get(f"/json/users/{iago.id}/subscriptions/{stream.id}").content
+        )
+        self.assertTrue(result["is_subscribed"])
+        self.unsubscribe(iago, stream.name)
+
         # Unsubscribed non-admins cannot check subscription status in a private stream.
         self.login("shiva")
         result = self.client_get(f"/json/users/{iago.id}/subscriptions/{stream.id}")
@@ -2695,10 +2778,14 @@ class BulkUsersTest(ZulipTestCase):
             [hamlet_data] = (row for row in rows if row["user_id"] == hamlet.id)
             return hamlet_data["avatar_url"]
 
-        self.assertEqual(
-            get_hamlet_avatar(client_gravatar=True),
-            None,
-        )
+        # No gravatar hashes are computed for users whose avatar the
+        # client will compute itself.
+        with mock.patch("zerver.lib.avatar.gravatar_hash") as mock_gravatar_hash:
+            self.assertEqual(
+                get_hamlet_avatar(client_gravatar=True),
+                None,
+            )
+        mock_gravatar_hash.assert_not_called()
 
         """
         The main purpose of this test is to make sure we
@@ -3404,6 +3491,13 @@ class DeleteUserTest(ZulipTestCase):
 
 
 class FakeEmailDomainTest(ZulipTestCase):
+    @override
+    def setUp(self) -> None:
+        super().setUp()
+        # get_fake_email_domain's validation results are cached for the
+        # whole process, so start each test from an empty cache.
+        _get_fake_email_domain.cache_clear()
+
     def test_get_fake_email_domain(self) -> None:
         realm = get_realm("zulip")
         self.assertEqual("zulip.testserver", get_fake_email_domain(realm.host))
@@ -3411,6 +3505,12 @@ class FakeEmailDomainTest(ZulipTestCase):
         with self.settings(EXTERNAL_HOST="example.com"):
             self.assertEqual("zulip.example.com", get_fake_email_domain(realm.host))
 
+    def test_get_fake_email_domain_cached(self) -> None:
+        with mock.patch("zerver.models.realms.validate_email") as mock_validate_email:
+            self.assertEqual("cached.example.com", get_fake_email_domain("cached.example.com"))
+            self.assertEqual("cached.example.com", get_fake_email_domain("cached.example.com"))
+        mock_validate_email.assert_called_once()
+
     @override_settings(FAKE_EMAIL_DOMAIN="fakedomain.com", REALM_HOSTS={"zulip": "127.0.0.1"})
     def test_get_fake_email_domain_realm_host_is_ip_addr(self) -> None:
         realm = get_realm("zulip")
@@ -10,8 +10,11 @@ from pydantic import BaseModel
 
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.response import json_success
+from zerver.lib.sessions import get_session_altcha_challenges
 from zerver.lib.typed_endpoint import typed_endpoint_without_parameters
 
+MAX_SESSION_ALTCHA_CHALLENGES = 10
+
 
 class AltchaPayload(BaseModel):
     algorithm: str
@@ -38,15 +41,18 @@ def get_challenge(
                 expires=expires,
             )
         )
-        session_challenges = request.session.get("altcha_challenges", [])
+        session_challenges = get_session_altcha_challenges(request.session)
         # We prune out expired challenges not for correctness (the
         # expiration is validated separately) but to prevent this from
         # growing without bound
-        session_challenges = [(c, e) for (c, e) in session_challenges if e > now.timestamp()]
-        request.session["altcha_challenges"] = [
-            *session_challenges,
-            (challenge.challenge, expires.timestamp()),
-        ]
+        session_challenges = {c: e for c, e in session_challenges.items() if e > now.timestamp()}
+        # Also cap how many unexpired challenges we hold, dropping the
+        # oldest, so a client fetching challenges in a loop can't
+        # bloat its session.
+        while len(session_challenges) >= MAX_SESSION_ALTCHA_CHALLENGES:
+            del session_challenges[next(iter(session_challenges))]
+        session_challenges[challenge.challenge] = expires.timestamp()
+        request.session["altcha_challenges"] = session_challenges
         return json_success(request, data=challenge.__dict__)
     except Exception as e:  # nocoverage
         logging.exception(e)
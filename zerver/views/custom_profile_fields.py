@@ -8,7 +8,7 @@ from django.utils.translation import gettext as _
 from pydantic import Json, StringConstraints
 
 from zerver.actions.custom_profile_fields import (
-    check_remove_custom_profile_field_value,
+    check_remove_custom_profile_field_values,
     do_remove_realm_custom_profile_field,
     do_update_user_custom_profile_data_if_changed,
     try_add_realm_custom_profile_field,
@@ -308,10 +308,7 @@ def remove_user_custom_profile_data(
     data: Json[list[int]],
 ) -> HttpResponse:
     with transaction.atomic(durable=True):
-        for field_id in data:
-            check_remove_custom_profile_field_value(
-                user_profile, field_id, acting_user=user_profile
-            )
+        check_remove_custom_profile_field_values(user_profile, data, acting_user=user_profile)
     return json_success(request)
 
 
@@ -582,7 +582,7 @@ def check_subdomain_available(request: HttpRequest, subdomain: str) -> HttpRespo
         check_subdomain(subdomain)
         return json_success(request, data={"msg": "available"})
     except ValidationError as e:
-        return json_success(request, data={"msg": e.message})
+        return json_success(request, data={"msg": str(e.message)})
 
 
 def realm_reactivation_get(request: HttpRequest, confirmation_key: str) -> HttpResponse:
@@ -7,10 +7,12 @@ from django.contrib.auth.models import AnonymousUser
 from django.core import validators
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import UploadedFile
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
 from django.utils.translation import gettext as _
+from psycopg2.errors import UniqueViolation
 from pydantic import AfterValidator, BaseModel, Json, StringConstraints
 
 from zerver.actions.bots import (
@@ -21,13 +23,14 @@ from zerver.actions.bots import (
 )
 from zerver.actions.create_user import do_create_user, do_reactivate_user, notify_created_bot
 from zerver.actions.custom_profile_fields import (
-    check_remove_custom_profile_field_value,
+    do_remove_custom_profile_field_values,
     do_update_user_custom_profile_data_if_changed,
+    validate_custom_profile_field_values_removable,
 )
 from zerver.actions.user_settings import (
     check_change_bot_full_name,
-    check_change_full_name,
     do_change_avatar_fields,
+    do_change_full_name,
     do_change_user_delivery_email,
     do_regenerate_api_key,
 )
@@ -40,8 +43,13 @@ from zerver.actions.users import (
 from zerver.context_processors import get_valid_realm_from_request
 from zerver.decorator import require_member_or_admin, require_realm_admin
 from zerver.forms import PASSWORD_TOO_WEAK_ERROR, CreateUserForm
-from zerver.lib.avatar import avatar_url, get_avatar_for_inaccessible_user, get_gravatar_url
-from zerver.lib.bot_config import set_bot_config
+from zerver.lib.avatar import (
+    avatar_url,
+    get_avatar_field,
+    get_avatar_for_inaccessible_user,
+    get_gravatar_url,
+)
+from zerver.lib.bot_config import bulk_set_bot_config
 from zerver.lib.email_validation import email_allowed_for_realm, validate_email_not_already_in_realm
 from zerver.lib.exceptions import (
     CannotDeactivateLastUserError,
@@ -51,10 +59,11 @@ from zerver.lib.exceptions import (
     OrganizationAdministratorRequiredError,
     OrganizationOwnerRequiredError,
 )
-from zerver.lib.integrations import EMBEDDED_BOTS
+from zerver.lib.integrations import EMBEDDED_BOT_NAMES
+from zerver.lib.queue import queue_event_on_commit
 from zerver.lib.rate_limiter import rate_limit_spectator_attachment_access_by_file
 from zerver.lib.response import json_success
-from zerver.lib.send_email import FromAddress, send_email
+from zerver.lib.send_email import FromAddress
 from zerver.lib.streams import access_stream_by_id, access_stream_by_name, subscribed_to_stream
 from zerver.lib.typed_endpoint import (
     ApiParamConfig,
@@ -72,6 +81,7 @@ from zerver.lib.users import (
     access_user_by_email,
     access_user_by_id,
     add_service,
+    check_bot_email_and_name_available,
     check_bot_name_available,
     check_can_access_user,
     check_can_create_bot,
@@ -94,13 +104,24 @@ from zerver.models.realms import (
     Realm,
 )
 from zerver.models.users import (
-    get_user_by_delivery_email,
     get_user_by_id_in_realm_including_cross_realm,
     get_user_including_cross_realm,
     get_user_profile_by_id_in_realm,
 )
 from zproject.backends import check_password_strength
 
+AVATAR_REDIRECT_CACHE_MAX_AGE = 60
+
+# The case-insensitive unique constraints on (realm, email) and
+# (realm, delivery_email); when the new user's email is visible, the
+# two columns match and either one may be the one that's violated.
+USER_EMAIL_UNIQUE_CONSTRAINTS = frozenset(
+    {
+        "zerver_userprofile_realm_id_email_uniq",
+        "zerver_userprofile_realm_id_delivery_email_uniq",
+    }
+)
+
 RoleParamType: TypeAlias = Annotated[
     int,
     check_int_in_validator(
@@ -110,8 +131,11 @@ RoleParamType: TypeAlias = Annotated[
 
 
 def check_last_owner(user_profile: UserProfile) -> bool:
-    owners = set(user_profile.realm.get_human_owner_users())
-    return user_profile.is_realm_owner and not user_profile.is_bot and len(owners) == 1
+    # Check the cheap conditions first, so that the common case of a
+    # non-owner doesn't need to query the database at all.
+    if not user_profile.is_realm_owner or user_profile.is_bot:
+        return False
+    return user_profile.realm.get_human_owner_users().count() == 1
 
 
 @typed_endpoint
@@ -139,9 +163,13 @@ def deactivate_user_backend(
 
 
 def deactivate_user_own_backend(request: HttpRequest, user_profile: UserProfile) -> HttpResponse:
-    if UserProfile.objects.filter(realm=user_profile.realm, is_active=True).count() == 1:
+    if (
+        not UserProfile.objects.filter(realm=user_profile.realm, is_active=True)
+        .exclude(id=user_profile.id)
+        .exists()
+    ):
         raise CannotDeactivateLastUserError(is_last_owner=False)
-    if user_profile.is_realm_owner and check_last_owner(user_profile):
+    if check_last_owner(user_profile):
         raise CannotDeactivateLastUserError(is_last_owner=True)
 
     do_deactivate_user(user_profile, acting_user=user_profile)
@@ -169,14 +197,19 @@ def _deactivate_user_profile_backend(
     # It's important that we check for None explicitly here, since ""
     # encodes sending an email without a custom administrator comment.
     if deactivation_notification_comment is not None:
-        send_email(
-            "zerver/emails/deactivate",
-            to_user_ids=[target.id],
-            from_address=FromAddress.NOREPLY,
-            context={
-                "deactivation_notification_comment": deactivation_notification_comment,
-                "realm_url": target.realm.url,
-                "realm_name": target.realm.name,
+        # Rendering and delivering the email can be slow, so hand it off
+        # to the email_senders queue worker once the deactivation commits.
+        queue_event_on_commit(
+            "email_senders",
+            {
+                "template_prefix": "zerver/emails/deactivate",
+                "to_user_ids": [target.id],
+                "from_address": FromAddress.NOREPLY,
+                "context": {
+                    "deactivation_notification_comment": deactivation_notification_comment,
+                    "realm_url": target.realm.url,
+                    "realm_name": target.realm.name,
+                },
             },
         )
     return json_success(request)
@@ -268,6 +301,9 @@ def update_user_backend(
     ):
         raise JsonableError(_("User not authorized to change user emails"))
 
+    # Validate every requested change before making any of them, so
+    # that an invalid parameter doesn't cost us a series of writes
+    # that the transaction then has to roll back.
     if role is not None and target.role != role:
         # Require that the current user has permissions to
         # grant/remove the role in question.
@@ -290,32 +326,27 @@ def update_user_backend(
 
             check_spare_license_available_for_changing_guest_user_role(user_profile.realm)
 
-        do_change_user_role(target, role, acting_user=user_profile)
-
-    if full_name is not None and target.full_name != full_name and full_name.strip() != "":
+    new_full_name: str | None = None
+    # Compare the stripped name, so that resubmitting the current name
+    # with stray whitespace skips check_full_name's uniqueness query.
+    if full_name is not None and full_name.strip() not in ("", target.full_name):
         # We don't respect `name_changes_disabled` here because the request
         # is on behalf of the administrator.
-        check_change_full_name(target, full_name, user_profile)
+        new_full_name = check_full_name(
+            full_name_raw=full_name, user_profile=target, realm=target.realm
+        )
 
     if profile_data is not None:
-        clean_profile_data: list[ProfileDataElementUpdateDict] = []
-        for entry in profile_data:
-            assert isinstance(entry.id, int)
-            assert not isinstance(entry.value, int)
-            if entry.value is None or not entry.value:
-                field_id = entry.id
-                check_remove_custom_profile_field_value(target, field_id, acting_user=user_profile)
-            else:
-                clean_profile_data.append(
-                    {
-                        "id": entry.id,
-                        "value": entry.value,
-                    }
-                )
+        remove_field_ids = [entry.id for entry in profile_data if not entry.value]
+        clean_profile_data: list[ProfileDataElementUpdateDict] = [
+            {"id": entry.id, "value": entry.value} for entry in profile_data if entry.value
+        ]
+        removed_fields = validate_custom_profile_field_values_removable(
+            target.realm, remove_field_ids, acting_user=user_profile
+        )
         validate_user_custom_profile_data(
             target.realm.id, clean_profile_data, acting_user=user_profile
         )
-        do_update_user_custom_profile_data_if_changed(target, clean_profile_data)
 
     if new_email is not None and target.delivery_email != new_email:
         assert user_profile.can_change_user_emails and user_profile.is_realm_admin
@@ -333,11 +364,35 @@ def update_user_backend(
         except ValidationError as e:
             raise JsonableError(_("New email value error: {message}").format(message=e.message))
 
+    if role is not None and target.role != role:
+        do_change_user_role(target, role, acting_user=user_profile)
+
+    if new_full_name is not None:
+        do_change_full_name(target, new_full_name, user_profile)
+
+    if profile_data is not None:
+        do_remove_custom_profile_field_values(target, remove_field_ids, removed_fields)
+        do_update_user_custom_profile_data_if_changed(target, clean_profile_data)
+
+    if new_email is not None and target.delivery_email != new_email:
         do_change_user_delivery_email(target, new_email, acting_user=user_profile)
 
     return json_success(request)
 
 
+def avatar_redirect(request: HttpRequest, url: str) -> HttpResponse:
+    if request.META["QUERY_STRING"]:
+        url = append_url_query_string(url, request.META["QUERY_STRING"])
+    response = redirect(url)
+    # Clients often request the same avatar many times in quick
+    # succession while rendering a message feed; let them reuse the
+    # redirect briefly.  The cache is private since the target depends
+    # on who is asking, and short since avatar changes should show up
+    # promptly.
+    patch_cache_control(response, private=True, max_age=AVATAR_REDIRECT_CACHE_MAX_AGE)
+    return response
+
+
 def avatar_by_id(
     request: HttpRequest,
     maybe_user_profile: UserProfile | AnonymousUser,
@@ -360,6 +415,9 @@ def avatar_by_id(
         realm = maybe_user_profile.realm
 
     try:
+        # This lookup is served from the remote cache, which is flushed
+        # whenever the user is saved, so repeated avatar requests for
+        # the same user don't reach the database.
         avatar_user_profile = get_user_by_id_in_realm_including_cross_realm(user_id, realm)
         url: str | None = None
         if maybe_user_profile.is_authenticated and not check_can_access_user(
@@ -374,9 +432,7 @@ def avatar_by_id(
         url = get_avatar_for_inaccessible_user()
 
     assert url is not None
-    if request.META["QUERY_STRING"]:
-        url = append_url_query_string(url, request.META["QUERY_STRING"])
-    return redirect(url)
+    return avatar_redirect(request, url)
 
 
 def avatar_by_email(
@@ -411,9 +467,7 @@ def avatar_by_email(
         url = get_gravatar_url(email, avatar_version, realm.id, medium)
 
     assert url is not None
-    if request.META["QUERY_STRING"]:
-        url = append_url_query_string(url, request.META["QUERY_STRING"])
-    return redirect(url)
+    return avatar_redirect(request, url)
 
 
 def avatar_medium(
@@ -452,7 +506,7 @@ def patch_bot_backend(
     service_interface: Json[int] = 1,
     service_payload_url: Json[Annotated[str, AfterValidator(check_url)]] | None = None,
 ) -> HttpResponse:
-    bot = access_bot_by_id(user_profile, bot_id)
+    bot = access_bot_by_id(user_profile, bot_id, for_serialization=True)
 
     if full_name is not None:
         check_change_bot_full_name(bot, full_name, user_profile)
@@ -601,7 +655,7 @@ def add_bot_backend(
     if bot_type == UserProfile.EMBEDDED_BOT:
         if not settings.EMBEDDED_BOTS_ENABLED:
             raise JsonableError(_("Embedded bots are not enabled."))
-        if service_name not in [bot.name for bot in EMBEDDED_BOTS]:
+        if service_name not in EMBEDDED_BOT_NAMES:
             raise JsonableError(_("Invalid embedded bot name."))
 
     if not form.is_valid():  # nocoverage
@@ -609,17 +663,7 @@ def add_bot_backend(
         # common situation where this might fail, but this case may be
         # still possible with an overly long username.
         raise JsonableError(_("Bad name or username"))
-    try:
-        get_user_by_delivery_email(email, user_profile.realm)
-        raise EmailAlreadyInUseError
-    except UserProfile.DoesNotExist:
-        pass
-
-    check_bot_name_available(
-        realm_id=user_profile.realm_id,
-        full_name=full_name,
-        is_activation=False,
-    )
+    check_bot_email_and_name_available(user_profile.realm_id, email, full_name)
 
     check_can_create_bot(user_profile, bot_type)
     check_valid_bot_type(user_profile, bot_type)
@@ -647,43 +691,52 @@ def add_bot_backend(
     if bot_type in (UserProfile.INCOMING_WEBHOOK_BOT, UserProfile.EMBEDDED_BOT) and service_name:
         check_valid_bot_config(bot_type, service_name, config_data)
 
-    bot_profile = do_create_user(
-        email=email,
-        password=None,
-        realm=user_profile.realm,
-        full_name=full_name,
-        bot_type=bot_type,
-        bot_owner=user_profile,
-        avatar_source=avatar_source,
-        default_sending_stream=default_sending_stream,
-        default_events_register_stream=default_events_register_stream,
-        default_all_public_streams=default_all_public_streams,
-        acting_user=user_profile,
-    )
-    if len(request.FILES) == 1:
-        [user_file] = request.FILES.values()
-        assert isinstance(user_file, UploadedFile)
-        assert user_file.size is not None
-        upload_avatar_image(user_file, bot_profile, future=False)
-
-    if bot_type in (UserProfile.OUTGOING_WEBHOOK_BOT, UserProfile.EMBEDDED_BOT):
-        assert isinstance(service_name, str)
-        add_service(
-            name=service_name,
-            user_profile=bot_profile,
-            base_url=payload_url,
-            interface=interface_type,
-            token=generate_api_key(),
+    # Create the bot and all of its associated rows in one transaction,
+    # so that a failure partway through (e.g. the bot config being too
+    # large) doesn't leave a partially configured bot behind.  The
+    # bot creation event is sent when the transaction commits.
+    with transaction.atomic(durable=True):
+        bot_profile = do_create_user(
+            email=email,
+            password=None,
+            realm=user_profile.realm,
+            full_name=full_name,
+            bot_type=bot_type,
+            bot_owner=user_profile,
+            avatar_source=avatar_source,
+            default_sending_stream=default_sending_stream,
+            default_events_register_stream=default_events_register_stream,
+            default_all_public_streams=default_all_public_streams,
+            acting_user=user_profile,
         )
 
-    if bot_type == UserProfile.INCOMING_WEBHOOK_BOT and service_name:
-        set_bot_config(bot_profile, "integration_id", service_name)
+        if bot_type in (UserProfile.OUTGOING_WEBHOOK_BOT, UserProfile.EMBEDDED_BOT):
+            assert isinstance(service_name, str)
+            add_service(
+                name=service_name,
+                user_profile=bot_profile,
+                base_url=payload_url,
+                interface=interface_type,
+                token=generate_api_key(),
+            )
+
+        if bot_type in (UserProfile.INCOMING_WEBHOOK_BOT, UserProfile.EMBEDDED_BOT):
+            bot_config_data = dict(config_data)
+            if bot_type == UserProfile.INCOMING_WEBHOOK_BOT and service_name:
+                bot_config_data = {"integration_id": service_name, **config_data}
+            bulk_set_bot_config(bot_profile, bot_config_data)
 
-    if bot_type in (UserProfile.INCOMING_WEBHOOK_BOT, UserProfile.EMBEDDED_BOT):
-        for key, value in config_data.items():
-            set_bot_config(bot_profile, key, value)
+        # The avatar is uploaded after the cheaper service and config
+        # writes, but inside the transaction and before the bot_add
+        # event, so that clients never see an avatar URL with no file
+        # behind it, and a failed upload rolls back the whole bot.
+        if len(request.FILES) == 1:
+            [user_file] = request.FILES.values()
+            assert isinstance(user_file, UploadedFile)
+            assert user_file.size is not None
+            upload_avatar_image(user_file, bot_profile, future=False)
 
-    notify_created_bot(bot_profile)
+        notify_created_bot(bot_profile)
 
     api_key = bot_profile.api_key
 
@@ -700,32 +753,46 @@ def add_bot_backend(
 
 @require_member_or_admin
 def get_bots_backend(request: HttpRequest, user_profile: UserProfile) -> HttpResponse:
-    bot_profiles = UserProfile.objects.filter(is_bot=True, is_active=True, bot_owner=user_profile)
-    bot_profiles = bot_profiles.select_related(
-        "default_sending_stream", "default_events_register_stream"
+    # Fetch just the columns we serialize, rather than constructing a
+    # full UserProfile (and two Stream objects) for each bot.
+    bot_dicts = (
+        UserProfile.objects.filter(is_bot=True, is_active=True, bot_owner=user_profile)
+        .order_by("date_joined")
+        .values(
+            "id",
+            "realm_id",
+            "email",
+            "delivery_email",
+            "full_name",
+            "api_key",
+            "avatar_source",
+            "avatar_version",
+            "default_sending_stream__name",
+            "default_events_register_stream__name",
+            "default_all_public_streams",
+        )
     )
-    bot_profiles = bot_profiles.order_by("date_joined")
-
-    def bot_info(bot_profile: UserProfile) -> dict[str, Any]:
-        default_sending_stream = get_stream_name(bot_profile.default_sending_stream)
-        default_events_register_stream = get_stream_name(bot_profile.default_events_register_stream)
-
-        # Bots are supposed to have only one API key, at least for now.
-        # Therefore we can safely assume that one and only valid API key will be
-        # the first one.
-        api_key = bot_profile.api_key
 
+    def bot_info(bot_dict: dict[str, Any]) -> dict[str, Any]:
         return dict(
-            username=bot_profile.email,
-            full_name=bot_profile.full_name,
-            api_key=api_key,
-            avatar_url=avatar_url(bot_profile),
-            default_sending_stream=default_sending_stream,
-            default_events_register_stream=default_events_register_stream,
-            default_all_public_streams=bot_profile.default_all_public_streams,
+            username=bot_dict["email"],
+            full_name=bot_dict["full_name"],
+            api_key=bot_dict["api_key"],
+            avatar_url=get_avatar_field(
+                user_id=bot_dict["id"],
+                realm_id=bot_dict["realm_id"],
+                email=bot_dict["delivery_email"],
+                avatar_source=bot_dict["avatar_source"],
+                avatar_version=bot_dict["avatar_version"],
+                medium=False,
+                client_gravatar=False,
+            ),
+            default_sending_stream=bot_dict["default_sending_stream__name"],
+            default_events_register_stream=bot_dict["default_events_register_stream__name"],
+            default_all_public_streams=bot_dict["default_all_public_streams"],
         )
 
-    return json_success(request, data={"bots": list(map(bot_info, bot_profiles))})
+    return json_success(request, data={"bots": list(map(bot_info, bot_dicts))})
 
 
 def get_user_data(
@@ -761,7 +828,7 @@ def get_user_data(
         assert user_ids is None
         data: dict[str, Any] = {"user": members[target_user.id]}
     else:
-        data = {"members": [members[k] for k in members]}
+        data = {"members": list(members.values())}
 
     return data
 
@@ -832,8 +899,13 @@ def create_user_backend(
     full_name = check_full_name(
         full_name_raw=full_name_raw, user_profile=user_profile, realm=user_profile.realm
     )
-    form = CreateUserForm({"full_name": full_name, "email": email})
-    if not form.is_valid():
+    # check_full_name has already validated the name, so we only need
+    # to check the email address syntax here.  Like the EmailField this
+    # replaces, ignore surrounding whitespace.
+    email = email.strip()
+    try:
+        validators.validate_email(email)
+    except ValidationError:
         raise JsonableError(_("Bad name or username"))
 
     # Check that the new user's email address belongs to the admin's realm
@@ -853,29 +925,39 @@ def create_user_backend(
     except EmailContainsPlusError:
         raise JsonableError(_("Email addresses containing + are not allowed."))
 
-    try:
-        get_user_by_delivery_email(email, user_profile.realm)
-        raise EmailAlreadyInUseError
-    except UserProfile.DoesNotExist:
-        pass
-
+    # Since there's no separate lookup for an existing user, a weak
+    # password is reported before a duplicate email address.
     if not check_password_strength(password):
         raise JsonableError(str(PASSWORD_TOO_WEAK_ERROR))
 
-    target_user = do_create_user(
-        email,
-        password,
-        realm,
-        full_name,
-        # Explicitly set tos_version=-1. This means that users
-        # created via this mechanism would be prompted to set
-        # the email_address_visibility setting on first login.
-        # For servers that have configured Terms of Service,
-        # users will also be prompted to accept the Terms of
-        # Service on first login.
-        tos_version=UserProfile.TOS_VERSION_BEFORE_FIRST_LOGIN,
-        acting_user=user_profile,
-    )
+    # Rather than checking for an existing user first, we rely on the
+    # case-insensitive email unique constraints, which also cover two
+    # concurrent requests for the same address.
+    try:
+        with transaction.atomic(durable=True):
+            target_user = do_create_user(
+                email,
+                password,
+                realm,
+                full_name,
+                # Explicitly set tos_version=-1. This means that users
+                # created via this mechanism would be prompted to set
+                # the email_address_visibility setting on first login.
+                # For servers that have configured Terms of Service,
+                # users will also be prompted to accept the Terms of
+                # Service on first login.
+                tos_version=UserProfile.TOS_VERSION_BEFORE_FIRST_LOGIN,
+                acting_user=user_profile,
+            )
+    except IntegrityError as e:
+        # Only a violation of an email uniqueness constraint means the
+        # address is taken; any other integrity error is a real bug.
+        if (
+            isinstance(e.__cause__, UniqueViolation)
+            and e.__cause__.diag.constraint_name in USER_EMAIL_UNIQUE_CONSTRAINTS
+        ):
+            raise EmailAlreadyInUseError
+        raise
     return json_success(request, data={"user_id": target_user.id})
 
 
@@ -905,7 +987,14 @@ def get_subscription_backend(
     target_user = access_user_by_id(user_profile, user_id, for_admin=False)
     (stream, sub) = access_stream_by_id(user_profile, stream_id, require_content_access=False)
 
-    subscription_status = {"is_subscribed": subscribed_to_stream(target_user, stream_id)}
+    if target_user.id == user_profile.id:
+        # access_stream_by_id already fetched the acting user's active
+        # subscription, so there's no need to query for it again.
+        is_subscribed = sub is not None
+    else:
+        is_subscribed = subscribed_to_stream(target_user, stream_id)
+
+    subscription_status = {"is_subscribed": is_subscribed}
 
     return json_success(request, data=subscription_status)
 
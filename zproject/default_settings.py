@@ -320,6 +320,12 @@ DEFAULT_RATE_LIMITING_RULES = {
     "sends_email_by_ip": [
         (86400, 5),
     ],
+    # Limits how many CAPTCHA solutions for creating a new
+    # organization can be submitted from each IP address. This sheds
+    # scripted load before we pay for verifying each solution.
+    "realm_creation_captcha_by_ip": [
+        (60, 5),
+    ],
     # Limits access to uploaded files, in web-public contexts, done by
     # unauthenticated users. Each file gets its own bucket, and every
     # access to the file by an unauthenticated user counts towards the